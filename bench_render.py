@@ -0,0 +1,91 @@
+import time
+import tempfile
+import argparse
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from scipy import signal
+from lod_render import load_cache, LodLine, LodSpectrogram
+
+
+def synthetic(minutes, fs):
+    """Noise with a slow tone and bursts, roughly like a vibration capture"""
+    n = int(minutes * 60 * fs)
+    t = np.arange(n) / fs
+    rng = np.random.default_rng(0)
+    sig = rng.standard_normal(n) + 3 * np.sin(2 * np.pi * 120 * t) * (np.sin(2 * np.pi * 0.1 * t) > 0.9)
+    return t, sig
+
+
+def draw_time(fig):
+    start = time.perf_counter()
+    fig.canvas.draw()
+    return time.perf_counter() - start
+
+
+def bench_full(t, sig, fs):
+    """Original plot_time_and_spectrogram: every sample, gouraud pcolormesh"""
+    start = time.perf_counter()
+    fig = plt.figure(figsize=(12, 8))
+    plt.subplot(2, 1, 1)
+    plt.plot(t - t[0], sig)
+    plt.subplot(2, 1, 2)
+    f, t_spec, Sxx = signal.spectrogram(sig, fs=fs, nperseg=256, noverlap=192, scaling='spectrum')
+    plt.pcolormesh(t_spec, f, 10 * np.log10(Sxx + 1e-12), shading='gouraud')
+    plt.colorbar(label='Power (dB)')
+    prepare = time.perf_counter() - start
+    draw = draw_time(fig)
+    plt.close(fig)
+    return prepare, draw
+
+
+def bench_lod(t, sig, fs, cache_dir, zoom_s=10.0):
+    """LOD rendering: cache build, cache reopen, full view and zoomed view draws"""
+    start = time.perf_counter()
+    load_cache(cache_dir, t, sig, fs)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    env, f, spec, clim = load_cache(cache_dir, t, sig, fs)
+    reopen = time.perf_counter() - start
+
+    fig = plt.figure(figsize=(12, 8))
+    ax_wave = plt.subplot(2, 1, 1)
+    LodLine(ax_wave, env, t_offset=t[0])
+    ax_spec = plt.subplot(2, 1, 2)
+    plt.colorbar(LodSpectrogram(ax_spec, f, spec, clim=clim).image, label='Power (dB)')
+    full = draw_time(fig)
+
+    mid = 0.5 * (t[-1] - t[0])
+    ax_wave.set_xlim(mid, mid + zoom_s)
+    ax_spec.set_xlim(mid, mid + zoom_s)
+    zoom = draw_time(fig)
+    plt.close(fig)
+    return build, reopen, full, zoom
+
+
+def main(minutes_list, fs=1000.0, skip_full_above=None):
+    print(f"{'minutes':>8} {'samples':>10} | {'full prep':>9} {'full draw':>9} | "
+          f"{'lod build':>9} {'reopen':>7} {'lod draw':>8} {'zoom draw':>9}")
+    for minutes in minutes_list:
+        t, sig = synthetic(minutes, fs)
+        if skip_full_above is None or minutes <= skip_full_above:
+            prep, draw = bench_full(t, sig, fs)
+            full_cols = f"{prep:9.3f} {draw:9.3f}"
+        else:
+            full_cols = f"{'-':>9} {'-':>9}"
+        with tempfile.TemporaryDirectory() as tmp:
+            build, reopen, lod, zoom = bench_lod(t, sig, fs, f"{tmp}/capture.lod")
+        print(f"{minutes:8.1f} {len(sig):10d} | {full_cols} | "
+              f"{build:9.3f} {reopen:7.3f} {lod:8.3f} {zoom:9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless draw-time benchmark: full-resolution vs LOD rendering (seconds)")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 5, 15, 30], help="Recording lengths to test")
+    parser.add_argument("--fs", type=float, default=1000.0, help="Sampling rate in Hz")
+    parser.add_argument("--skip-full-above", type=float, default=None,
+                        help="Don't run the full-resolution renderer above this many minutes")
+    args = parser.parse_args()
+    main(args.minutes, fs=args.fs, skip_full_above=args.skip_full_above)
@@ -0,0 +1,107 @@
+import numpy as np
+
+# Gap kinds stored in the table
+GAP = 0          # a few reports missing (dropped / empty reads)
+STALL = 1        # long silence: sensor idle or USB stall
+DUPLICATE = 2    # timestamp did not advance
+CLOCK_STEP = 3   # timestamp went backwards
+
+KIND_NAMES = {GAP: "gap", STALL: "stall", DUPLICATE: "duplicate", CLOCK_STEP: "clock_step"}
+KIND_CODES = {name: code for code, name in KIND_NAMES.items()}
+
+GAP_DTYPE = np.dtype([
+    ("index", np.int64),      # i: the interval is between report i and i+1
+    ("t_start", np.float64),  # time of report i
+    ("t_end", np.float64),    # time of report i+1
+    ("kind", np.int8),
+])
+
+# Classification thresholds used by index_gaps, stored with the table so a
+# cached one is only reused if it was built the same way
+DEFAULT_PARAMS = {"gap_factor": 2.5, "stall_s": 0.05, "dup_factor": 0.05}
+
+
+def index_gaps(times, nominal_dt=None, gap_factor=DEFAULT_PARAMS["gap_factor"],
+               stall_s=DEFAULT_PARAMS["stall_s"], dup_factor=DEFAULT_PARAMS["dup_factor"]):
+    """
+    Classify inter-report intervals in one vectorized pass.
+    times: report timestamps in capture order (seconds)
+    nominal_dt: expected report period; median of the positive intervals if None
+    returns: (gap_table, nominal_dt), gap_table is a structured array of GAP_DTYPE
+    """
+    times = np.asarray(times, dtype=float)
+    if len(times) < 2:
+        return np.zeros(0, dtype=GAP_DTYPE), nominal_dt
+    dt = np.diff(times)
+
+    if nominal_dt is None:
+        positive = dt[dt > 0]
+        nominal_dt = float(np.median(positive)) if len(positive) else 0.0
+
+    kind = np.full(len(dt), -1, dtype=np.int8)
+    kind[dt > gap_factor * nominal_dt] = GAP
+    kind[dt > max(stall_s, gap_factor * nominal_dt)] = STALL
+    kind[(dt >= 0) & (dt <= dup_factor * nominal_dt)] = DUPLICATE
+    kind[dt < 0] = CLOCK_STEP
+
+    idx = np.flatnonzero(kind >= 0)
+    table = np.zeros(len(idx), dtype=GAP_DTYPE)
+    table["index"] = idx
+    table["t_start"] = times[idx]
+    table["t_end"] = times[idx + 1]
+    table["kind"] = kind[idx]
+    return table, nominal_dt
+
+
+def gaps_to_json(table, nominal_dt, n_reports, params=None):
+    """
+    Column-wise dict for the capture metadata.
+    n_reports: length of the timeline the table was built over
+    params: index_gaps thresholds, DEFAULT_PARAMS if None
+    """
+    return {
+        "n_reports": int(n_reports),
+        "params": dict(DEFAULT_PARAMS if params is None else params),
+        "nominal_dt": nominal_dt,
+        "index": table["index"].tolist(),
+        "t_start": table["t_start"].tolist(),
+        "t_end": table["t_end"].tolist(),
+        "kind": [KIND_NAMES[k] for k in table["kind"].tolist()],
+    }
+
+
+def gaps_from_json(meta):
+    """Inverse of gaps_to_json, returns (gap_table, nominal_dt)"""
+    table = np.zeros(len(meta["index"]), dtype=GAP_DTYPE)
+    table["index"] = meta["index"]
+    table["t_start"] = meta["t_start"]
+    table["t_end"] = meta["t_end"]
+    table["kind"] = [KIND_CODES[k] for k in meta["kind"]]
+    return table, meta["nominal_dt"]
+
+
+def summarize(table):
+    """Count of rows per kind name"""
+    counts = np.bincount(table["kind"].astype(np.int64), minlength=len(KIND_NAMES))
+    return {KIND_NAMES[k]: int(counts[k]) for k in KIND_NAMES}
+
+
+def in_holes(t, table):
+    """Mask of times t falling strictly inside a gap or stall of the table"""
+    t = np.asarray(t, dtype=float)
+    holes = table[np.isin(table["kind"], (GAP, STALL))]
+    if len(holes) == 0:
+        return np.zeros(len(t), dtype=bool)
+    holes = holes[np.argsort(holes["t_start"], kind="stable")]
+    pos = np.searchsorted(holes["t_start"], t, side="right") - 1
+    return (pos >= 0) & (t > holes["t_start"][pos]) & (t < holes["t_end"][pos])
+
+
+def split_segments(n_reports, table, kinds=(CLOCK_STEP,)):
+    """
+    Report index ranges [start, stop) between rows of the given kinds.
+    The timeline is continuous inside each range.
+    """
+    cuts = table["index"][np.isin(table["kind"], kinds)] + 1
+    bounds = np.concatenate(([0], cuts, [n_reports]))
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
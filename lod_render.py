@@ -0,0 +1,230 @@
+import json
+import zlib
+import numpy as np
+from pathlib import Path
+from scipy import signal
+from gap_index import index_gaps, split_segments
+
+# Samples per block grow by this factor from one envelope level to the next
+ENVELOPE_FACTOR = 4
+# Spectrogram columns are pooled in pairs per level (mean power)
+SPEC_FACTOR = 2
+# Frames per spectrogram call, keeps memory flat on long recordings
+SPEC_CHUNK_COLS = 4096
+# Bumped when the cached layout or pooling changes, older caches are rebuilt
+CACHE_VERSION = 3
+
+
+def envelope_pyramid(t, sig, factor=ENVELOPE_FACTOR):
+    """
+    Min/max envelope levels of a waveform.
+    returns: list of (t_block_start, mins, maxs); level 0 is the raw signal
+    """
+    t = np.asarray(t, dtype=float)
+    sig = np.asarray(sig, dtype=np.float32)
+    levels = [(t, sig, sig)]
+    while len(levels[-1][0]) > factor:
+        bt, mins, maxs = levels[-1]
+        pad = (-len(bt)) % factor
+        if pad:
+            mins = np.concatenate((mins, np.repeat(mins[-1], pad)))
+            maxs = np.concatenate((maxs, np.repeat(maxs[-1], pad)))
+        levels.append((bt[::factor],
+                       mins.reshape(-1, factor).min(axis=1),
+                       maxs.reshape(-1, factor).max(axis=1)))
+    return levels
+
+
+def spectrogram_pyramid(sig, fs, nperseg=256, noverlap=192, factor=SPEC_FACTOR):
+    """
+    Spectrogram in dB at several time resolutions.
+    returns: (freqs, levels), levels is a list of (t_cols, db) with db shaped
+    (columns, freqs) so a time range is a contiguous slice
+    """
+    sig = np.asarray(sig, dtype=float)
+    if len(sig) < 2:
+        return np.fft.rfftfreq(nperseg, d=1.0 / fs), []
+    if len(sig) < nperseg:
+        # Shrink the frame to fit, like scipy does, keeping the overlap ratio
+        noverlap = noverlap * len(sig) // nperseg
+        nperseg = len(sig)
+    hop = nperseg - noverlap
+    cols = []
+    t_cols = []
+    f = np.fft.rfftfreq(nperseg, d=1.0 / fs)
+    # Chunks start on a frame boundary and overlap by noverlap, so frames match a single call
+    for start in range(0, max(1, len(sig) - noverlap), hop * SPEC_CHUNK_COLS):
+        chunk = sig[start:start + hop * SPEC_CHUNK_COLS + noverlap]
+        if len(chunk) < nperseg:
+            break
+        f, t_spec, Sxx = signal.spectrogram(chunk, fs=fs, nperseg=nperseg, noverlap=noverlap, scaling='spectrum')
+        cols.append((10 * np.log10(Sxx + 1e-12)).T.astype(np.float32))
+        t_cols.append(t_spec + start / fs)
+    if not cols:
+        return f, []
+
+    levels = [(np.concatenate(t_cols), np.concatenate(cols))]
+    while len(levels[-1][0]) > factor:
+        tc, db = levels[-1]
+        n = len(tc) - len(tc) % factor
+        # Average power, not dB: max-pooling would lift the noise floor at every level
+        power = 10 ** (db[:n].reshape(-1, factor, db.shape[1]).astype(np.float64) / 10)
+        levels.append((tc[:n].reshape(-1, factor).mean(axis=1),
+                       (10 * np.log10(power.mean(axis=1))).astype(np.float32)))
+    return f, levels
+
+
+def color_limits(levels, low_pct=1.0):
+    """dB colour range (vmin, vmax) from the unpooled level of a spectrogram pyramid"""
+    db = np.asarray(levels[0][1])
+    return float(np.percentile(db, low_pct)), float(np.max(db))
+
+
+def _key(t, sig, fs):
+    return {
+        "version": CACHE_VERSION,
+        "n": int(len(sig)),
+        "fs": float(fs),
+        "crc": zlib.crc32(np.ascontiguousarray(sig, dtype=np.float64).tobytes())
+               ^ zlib.crc32(np.ascontiguousarray(t, dtype=np.float64).tobytes()),
+    }
+
+
+def build_cache(cache_dir, t, sig, fs):
+    """Compute both pyramids and store them as .npy files in cache_dir"""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    env = envelope_pyramid(t, sig)
+    f, spec = spectrogram_pyramid(sig, fs)
+    for k, (bt, mins, maxs) in enumerate(env):
+        np.save(cache_dir / f"wave_{k}_t.npy", bt)
+        np.save(cache_dir / f"wave_{k}_min.npy", mins)
+        np.save(cache_dir / f"wave_{k}_max.npy", maxs)
+    np.save(cache_dir / "spec_f.npy", f)
+    for k, (tc, db) in enumerate(spec):
+        np.save(cache_dir / f"spec_{k}_t.npy", tc)
+        np.save(cache_dir / f"spec_{k}_db.npy", db)
+    clim = color_limits(spec) if spec else None
+    meta = dict(_key(t, sig, fs), wave_levels=len(env), spec_levels=len(spec), clim=clim)
+    with open(cache_dir / "meta.json", "w") as fp:
+        json.dump(meta, fp, indent=2)
+    return env, f, spec, clim
+
+
+def load_cache(cache_dir, t, sig, fs):
+    """
+    Pyramids for this signal, memory-mapped from cache_dir when it matches,
+    rebuilt otherwise. Returns (envelope_levels, freqs, spec_levels, clim),
+    clim being the spectrogram's (vmin, vmax) in dB
+    """
+    cache_dir = Path(cache_dir)
+    meta_path = cache_dir / "meta.json"
+    if meta_path.exists():
+        with open(meta_path, "r") as fp:
+            meta = json.load(fp)
+        if {k: meta.get(k) for k in ("version", "n", "fs", "crc")} == _key(t, sig, fs):
+            load = lambda name: np.load(cache_dir / name, mmap_mode='r')
+            env = [(load(f"wave_{k}_t.npy"), load(f"wave_{k}_min.npy"), load(f"wave_{k}_max.npy"))
+                   for k in range(meta["wave_levels"])]
+            spec = [(load(f"spec_{k}_t.npy"), load(f"spec_{k}_db.npy"))
+                    for k in range(meta["spec_levels"])]
+            clim = tuple(meta["clim"]) if meta["clim"] is not None else None
+            return env, load("spec_f.npy"), spec, clim
+    return build_cache(cache_dir, t, sig, fs)
+
+
+def _visible(t, lo, hi):
+    """Index range of t covering [lo, hi], one extra point on each side"""
+    i0 = max(0, int(np.searchsorted(t, lo, side='right')) - 1)
+    i1 = min(len(t), int(np.searchsorted(t, hi, side='left')) + 1)
+    return i0, max(i1, i0 + 1)
+
+
+def _pick_level(levels, lo, hi, width_px):
+    """Coarsest level that still has at least one point per pixel in view"""
+    for k in range(len(levels) - 1, 0, -1):
+        i0, i1 = _visible(levels[k][0], lo, hi)
+        if i1 - i0 >= width_px:
+            return k
+    return 0
+
+
+class LodLine:
+    """Waveform drawn from the envelope level matching the current zoom"""
+
+    def __init__(self, ax, levels, t_offset=0.0, **kwargs):
+        self.ax = ax
+        self.levels = levels
+        self.t_offset = t_offset
+        self.line, = ax.plot([], [], **kwargs)
+        t = levels[0][0]
+        # Data limits from the coarsest level, so several lines on one axes autoscale together
+        ax.update_datalim([(t[0] - t_offset, float(np.min(levels[-1][1]))),
+                           (t[-1] - t_offset, float(np.max(levels[-1][2])))])
+        ax.autoscale_view()
+        ax.callbacks.connect('xlim_changed', lambda _ax: self.update())
+        self.update()
+
+    def update(self):
+        lo, hi = (x + self.t_offset for x in self.ax.get_xlim())
+        width_px = max(1, int(self.ax.bbox.width))
+        k = _pick_level(self.levels, lo, hi, width_px)
+        bt, mins, maxs = self.levels[k]
+        i0, i1 = _visible(bt, lo, hi)
+        x = np.asarray(bt[i0:i1]) - self.t_offset
+        if k == 0:
+            self.line.set_data(x, np.asarray(mins[i0:i1]))
+            return
+        # Each block becomes a vertical min->max stroke
+        self.line.set_data(np.repeat(x, 2),
+                           np.column_stack((mins[i0:i1], maxs[i0:i1])).ravel())
+
+
+def plot_lod(ax, t, sig, **kwargs):
+    """
+    LodLine per stretch of t between clock steps (LodLine needs increasing
+    times to find the visible slice). The pieces share one colour and label.
+    """
+    t = np.asarray(t, dtype=float)
+    lines = []
+    for a, b in split_segments(len(t), index_gaps(t)[0]):
+        lines.append(LodLine(ax, envelope_pyramid(t[a:b], sig[a:b]), **kwargs))
+        kwargs.setdefault('color', lines[0].line.get_color())
+        kwargs.pop('label', None)
+    return lines
+
+
+class LodSpectrogram:
+    """Spectrogram image drawn from the pooled level matching the current zoom"""
+
+    def __init__(self, ax, freqs, levels, clim=None, **kwargs):
+        self.ax = ax
+        self.freqs = np.asarray(freqs)
+        self.levels = levels
+        # Cell sizes, so the image extent runs over cell edges rather than centres
+        self.df = self.freqs[1] - self.freqs[0] if len(self.freqs) > 1 else 1.0
+        tc0 = levels[0][0]
+        # A lone frame starts at 0, so it is twice its centre wide
+        self.col_width = tc0[1] - tc0[0] if len(tc0) > 1 else 2 * tc0[0]
+        # Colours from the unpooled data, pooled levels don't show the real noise floor
+        vmin, vmax = color_limits(levels) if clim is None else clim
+        kwargs.setdefault('vmin', vmin)
+        kwargs.setdefault('vmax', vmax)
+        top = np.asarray(levels[-1][1])
+        self.image = ax.imshow(top.T, origin='lower', aspect='auto', interpolation='bilinear', **kwargs)
+        ax.set_xlim(tc0[0] - self.col_width / 2, tc0[-1] + self.col_width / 2)
+        ax.set_ylim(self.freqs[0] - self.df / 2, self.freqs[-1] + self.df / 2)
+        ax.callbacks.connect('xlim_changed', lambda _ax: self.update())
+        self.update()
+
+    def update(self):
+        lo, hi = self.ax.get_xlim()
+        width_px = max(1, int(self.ax.bbox.width))
+        k = _pick_level(self.levels, lo, hi, width_px)
+        tc, db = self.levels[k]
+        i0, i1 = _visible(tc, lo, hi)
+        self.image.set_data(np.asarray(db[i0:i1]).T)
+        # Pooling merges SPEC_FACTOR columns per level
+        half = self.col_width * SPEC_FACTOR ** k / 2
+        self.image.set_extent((tc[i0] - half, tc[i1 - 1] + half,
+                               self.freqs[0] - self.df / 2, self.freqs[-1] + self.df / 2))
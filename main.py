@@ -5,6 +5,13 @@ import matplotlib.pyplot as plt
 import matplotlib
 from datetime import datetime
 import json
+import sys
+from collections import deque
+from multiprocessing import Process
+from gap_index import index_gaps, gaps_to_json
+from pipeline import ReportRing, stream_to_wav
+from lod_render import envelope_pyramid, LodLine, plot_lod
+from process_mouse_json import decode_xy
 
 matplotlib.use('TkAgg') 
 
@@ -17,6 +24,8 @@ class MouseVibrationAnalyzer:
         self.raw_data = []
         self.movements = []
         self.recording = False
+        # Seconds without progress from the processing worker before giving up on it
+        self.drain_timeout = 5.0
 
     def find_mouse(self):
         """Поиск HID-устройства типа мышь"""
@@ -79,6 +88,72 @@ class MouseVibrationAnalyzer:
         finally:
             self.recording = False
 
+    def record_to_ring(self, ring_name, duration=15):
+        """Capture process: decode reports straight into the shared ring"""
+        ring = ReportRing(name=ring_name)
+        if not self.connect():
+            ring.mark_failed()
+            ring.mark_done()
+            ring.close()
+            return False
+        ring.mark_connected()
+        print(f"Starting pipelined record for {duration} seconds...")
+        self.raw_data = []
+        backlog = deque()
+        peak_backlog = 0
+        start_time = time.time()
+        self.recording = True
+
+        try:
+            while time.time() - start_time < duration:
+                data = self.device.read(64)
+                if data:
+                    ts = time.time() - start_time
+                    raw = bytes(data)
+                    self.raw_data.append((ts, raw))
+                    xy = decode_xy(raw)
+                    if xy is not None:
+                        backlog.append((ts, *xy))
+                # Ring full: keep reports locally instead of blocking the read loop
+                peak_backlog = max(peak_backlog, len(backlog))
+                while backlog and ring.push(*backlog[0]):
+                    backlog.popleft()
+                time.sleep(1 / self.sample_rate)
+            # Drain the backlog, giving up once the consumer stops making progress
+            consumed = ring.consumed
+            last_progress = time.time()
+            while backlog:
+                if ring.push(*backlog[0]):
+                    backlog.popleft()
+                    continue
+                if ring.consumed != consumed:
+                    consumed = ring.consumed
+                    last_progress = time.time()
+                elif time.time() - last_progress > self.drain_timeout:
+                    print(f"Processing worker stopped consuming, dropped {len(backlog)} reports")
+                    break
+                time.sleep(0.001)
+            print(f"Record finished! Captured packets: {len(self.raw_data)}")
+            if ring.full_count:
+                print(f"Ring was full {ring.full_count} times, peak backlog {peak_backlog} reports")
+        except KeyboardInterrupt:
+            print("Stopped by user")
+            ring.mark_failed()
+            return False
+        except Exception as e:
+            print(f"Recording error: {e}")
+            ring.mark_failed()
+            return False
+        finally:
+            self.recording = False
+            ring.mark_done()
+            ring.close()
+
+        # Same as run() after record_raw: only a finished recording is decoded and saved
+        self.decode()
+        self.save()
+        return True
+
     def decode(self):
         """Converting bytes to movement X/Y"""
         if not self.raw_data:
@@ -87,11 +162,9 @@ class MouseVibrationAnalyzer:
         print("Decoding data...")
         self.movements = []
         for ts, raw in self.raw_data:
-            if len(raw) < 3:
-                continue
-            x = raw[1] - 256 if raw[1] > 127 else raw[1]
-            y = raw[2] - 256 if raw[2] > 127 else raw[2]
-            self.movements.append((ts, x, y))
+            xy = decode_xy(raw)
+            if xy is not None:
+                self.movements.append((ts, *xy))
         print(f"Decoded {len(self.movements)} movements")
 
     def analyze(self):
@@ -126,20 +199,21 @@ class MouseVibrationAnalyzer:
 
         # Визуализация
         plt.figure(figsize=(15, 10))
-        plt.subplot(3, 1, 1)
-        plt.plot(timestamps, xs, label="X", alpha=0.7)
-        plt.plot(timestamps, ys, label="Y", alpha=0.7)
+        # Min/max envelopes, so long recordings draw only what fits on screen
+        ax = plt.subplot(3, 1, 1)
+        plot_lod(ax, timestamps, xs, label="X", alpha=0.7)
+        plot_lod(ax, timestamps, ys, label="Y", alpha=0.7)
         plt.title("Изменения X/Y")
         plt.legend()
         plt.grid(True)
 
-        plt.subplot(3, 1, 2)
-        plt.plot(timestamps, magnitude, color="green", alpha=0.8)
+        ax = plt.subplot(3, 1, 2)
+        plot_lod(ax, timestamps, magnitude, color="green", alpha=0.8)
         plt.title("Магнитуда движений")
         plt.grid(True)
 
-        plt.subplot(3, 1, 3)
-        plt.plot(freqs[freqs > 0], np.abs(fft_result)[freqs > 0])
+        ax = plt.subplot(3, 1, 3)
+        LodLine(ax, envelope_pyramid(freqs[freqs > 0], np.abs(fft_result)[freqs > 0]))
         plt.title("Частотный спектр вибраций")
         plt.xlabel("Частота (Гц)")
         plt.ylabel("Амплитуда")
@@ -154,6 +228,9 @@ class MouseVibrationAnalyzer:
             return
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"mouse_data_{ts}.json"
+        # Gap table over the decoded reports, so post-processing can skip the analysis
+        gap_times = [m[0] for m in self.movements]
+        gaps, nominal_dt = index_gaps(gap_times)
         with open(filename, "w") as f:
             json.dump({
                 "metadata": {
@@ -161,6 +238,7 @@ class MouseVibrationAnalyzer:
                     "packets": len(self.raw_data),
                     "vendor_id": self.vendor_id,
                     "product_id": self.product_id,
+                    "gaps": gaps_to_json(gaps, nominal_dt, len(gap_times)),
                 },
                 "raw_data": [
                     {"t": t, "bytes": raw.hex()} for t, raw in self.raw_data
@@ -178,11 +256,40 @@ class MouseVibrationAnalyzer:
         self.save()
         print("Finished successfully!")
 
+    def run_pipelined(self, duration=15, wav_path="mouse_sound.wav"):
+        """Capture and audio processing in separate processes, sharing a memory ring"""
+        if not self.find_mouse(): return
+        ring = ReportRing()
+        worker = Process(target=stream_to_wav, args=(ring.name, wav_path, float(self.sample_rate)))
+        capture = Process(target=self.record_to_ring, args=(ring.name, duration))
+        worker.start()
+        capture.start()
+        try:
+            capture.join()
+        finally:
+            # Let the worker drain the ring even if capture died early
+            if capture.exitcode != 0:
+                ring.mark_failed()
+            ring.mark_done()
+            worker.join()
+            captured = ring.connected and not ring.failed
+            ring.close()
+        if capture.exitcode != 0 or not captured:
+            print("Capture failed")
+            return
+        if worker.exitcode != 0:
+            print("Processing worker failed")
+            return
+        print("Finished successfully!")
+
 
 if __name__ == "__main__":
     analyzer = MouseVibrationAnalyzer()
     try:
-        analyzer.run(duration=10)
+        if "--pipelined" in sys.argv:
+            analyzer.run_pipelined(duration=10)
+        else:
+            analyzer.run(duration=10)
     except KeyboardInterrupt:
         print("\nStopped by user")
     finally:
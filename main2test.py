@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 import matplotlib
 from datetime import datetime
 import json
+from gap_index import index_gaps, gaps_to_json
 
 matplotlib.use('TkAgg')
 
@@ -172,6 +173,9 @@ class MouseVibrationAnalyzer:
             return
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"mouse_data_{ts}.json"
+        # Gap table over the decoded reports, so post-processing can skip the analysis
+        gap_times = [m[0] for m in self.movements]
+        gaps, nominal_dt = index_gaps(gap_times)
         with open(filename, "w") as f:
             json.dump({
                 "metadata": {
@@ -181,6 +185,7 @@ class MouseVibrationAnalyzer:
                     "product_id": self.product_id,
                     "usage_page": self.usage_page,
                     "usage": self.usage,
+                    "gaps": gaps_to_json(gaps, nominal_dt, len(gap_times)),
                 },
                 "raw_data": [
                     {"t": t, "bytes": raw.hex()} for t, raw in self.raw_data
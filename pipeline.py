@@ -0,0 +1,289 @@
+import time
+import wave
+from collections import deque
+from pathlib import Path
+import numpy as np
+from multiprocessing import shared_memory
+from scipy import signal
+from gap_index import index_gaps, in_holes, DEFAULT_PARAMS
+from process_mouse_json import BANDPASS_LOW_HZ, BANDPASS_HIGH_HZ
+
+# One decoded HID report per slot
+REPORT_DTYPE = np.dtype([("t", np.float64), ("x", np.int16), ("y", np.int16)])
+
+# Header slots (int64): total written, total consumed, capture finished, times the ring was full,
+# capture connected to the device, capture failed
+HEAD, TAIL, DONE, FULL, CONNECTED, FAILED = range(6)
+HEADER_SLOTS = 6
+HEADER_BYTES = HEADER_SLOTS * 8
+
+class ReportRing:
+    """
+    Single-producer / single-consumer ring of decoded reports in shared memory.
+    Creates the block when name is None, attaches to an existing one otherwise.
+    """
+
+    def __init__(self, name=None, capacity=1 << 16):
+        if name is None:
+            size = HEADER_BYTES + capacity * REPORT_DTYPE.itemsize
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            capacity = (self.shm.size - HEADER_BYTES) // REPORT_DTYPE.itemsize
+        self.capacity = capacity
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=self.shm.buf)
+        self.slots = np.ndarray((capacity,), dtype=REPORT_DTYPE, buffer=self.shm.buf, offset=HEADER_BYTES)
+        if self.owner:
+            self.header[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def push(self, t, x, y):
+        """Append one report. Returns False when the ring is full (backpressure)"""
+        head = int(self.header[HEAD])
+        if head - int(self.header[TAIL]) >= self.capacity:
+            self.header[FULL] += 1
+            return False
+        self.slots[head % self.capacity] = (t, x, y)
+        self.header[HEAD] = head + 1
+        return True
+
+    def peek(self):
+        """Zero-copy view of the readable reports up to the wrap point"""
+        tail = int(self.header[TAIL])
+        available = int(self.header[HEAD]) - tail
+        start = tail % self.capacity
+        return self.slots[start:start + min(available, self.capacity - start)]
+
+    @property
+    def consumed(self):
+        """Total reports released by the consumer so far"""
+        return int(self.header[TAIL])
+
+    def release(self, n):
+        """Mark n reports as consumed, freeing their slots for the producer"""
+        self.header[TAIL] += n
+
+    @property
+    def full_count(self):
+        """Pushes refused because the ring was full"""
+        return int(self.header[FULL])
+
+    def mark_done(self):
+        self.header[DONE] = 1
+
+    @property
+    def done(self):
+        return bool(self.header[DONE])
+
+    def mark_connected(self):
+        self.header[CONNECTED] = 1
+
+    @property
+    def connected(self):
+        return bool(self.header[CONNECTED])
+
+    def mark_failed(self):
+        """Capture didn't produce a usable recording, the worker must not write output"""
+        self.header[FAILED] = 1
+
+    @property
+    def failed(self):
+        return bool(self.header[FAILED])
+
+    def close(self):
+        # Drop the views before closing, the buffer can't be released while they exist
+        del self.header, self.slots
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class StreamResampler:
+    """
+    Incremental version of process_mouse_json.to_uniform with a gap table:
+    samples inside gaps/stalls are zero-filled, duplicate reports are dropped
+    and the timeline is split at clock steps, the next segment starting one
+    sample after the last emitted one.
+    The report period follows the running median of the last window intervals.
+    Reports are held back until min_intervals have been seen, so the first
+    block doesn't fix the period; flush() emits them with seed_dt (1/fs if
+    None) when the stream ends before that.
+    """
+
+    def __init__(self, fs, seed_dt=None, window=1024, min_intervals=16):
+        self.fs = fs
+        self.nominal_dt = 1.0 / fs if seed_dt is None else seed_dt
+        self.intervals = deque(maxlen=window)
+        self.min_intervals = min_intervals
+        self.dup_factor = DEFAULT_PARAMS["dup_factor"]
+        self.pending = []
+        self.t0 = None
+        self.n_out = 0
+        self.last_raw_t = None
+        self.last_t = None
+        self.last_v = None
+
+    def push(self, t, v):
+        t = np.asarray(t, dtype=float)
+        v = np.asarray(v, dtype=float)
+        if len(t) == 0:
+            return np.array([])
+        prev = np.concatenate(([np.inf if self.last_raw_t is None else self.last_raw_t], t[:-1]))
+        dt = t - prev
+        self.last_raw_t = t[-1]
+        self.intervals.extend(dt[(dt > 0) & np.isfinite(dt)].tolist())
+        self.pending.append((t, v, dt))
+        if len(self.intervals) < self.min_intervals:
+            return np.array([])
+        self.nominal_dt = float(np.median(self.intervals))
+        return self.flush()
+
+    def flush(self):
+        """Resample everything held back so far"""
+        if not self.pending:
+            return np.array([])
+        t, v, dt = (np.concatenate(parts) for parts in zip(*self.pending))
+        self.pending = []
+
+        step = dt < 0
+        step[0] |= self.last_t is None
+        dup = (dt >= 0) & (dt <= self.dup_factor * self.nominal_dt)
+        segment = np.cumsum(step)
+        out = []
+        for s in np.unique(segment):
+            in_seg = segment == s
+            if step[in_seg][0]:
+                # New timeline: no interpolation back across the step
+                self.last_t = None
+            keep = in_seg & ~dup
+            out.append(self._emit(t[keep], v[keep]))
+        return np.concatenate(out)
+
+    def _emit(self, t, v):
+        """Grid samples up to the last report of a continuous stretch"""
+        if len(t) == 0:
+            return np.array([])
+        if self.last_t is None:
+            self.t0 = t[0] - self.n_out / self.fs
+        else:
+            t = np.concatenate(([self.last_t], t))
+            v = np.concatenate(([self.last_v], v))
+        self.last_t = t[-1]
+        self.last_v = v[-1]
+
+        n_new = int(np.floor((t[-1] - self.t0) * self.fs + 1e-6)) + 1 - self.n_out
+        if n_new <= 0:
+            return np.array([])
+        t_grid = self.t0 + (self.n_out + np.arange(n_new)) / self.fs
+        out = np.interp(t_grid, t, v)
+        gaps, _ = index_gaps(t, self.nominal_dt)
+        out[in_holes(t_grid, gaps)] = 0.0
+        self.n_out += n_new
+        return out
+
+
+class StreamBandpass:
+    """Causal bandpass carrying filter state across blocks (filtfilt needs the whole signal)"""
+
+    def __init__(self, fs, low_hz=BANDPASS_LOW_HZ, high_hz=BANDPASS_HIGH_HZ, order=4):
+        if high_hz < 0.5 * fs:
+            self.sos = signal.butter(order, [low_hz, high_hz], btype='band', fs=fs, output='sos')
+        else:
+            self.sos = signal.butter(order, low_hz, btype='highpass', fs=fs, output='sos')
+        self.zi = np.zeros((self.sos.shape[0], 2))
+
+    def push(self, x):
+        if len(x) == 0:
+            return x
+        y, self.zi = signal.sosfilt(self.sos, x, zi=self.zi)
+        return y
+
+
+class StreamWav:
+    """
+    Mono audio streamed block by block as float32 to a .f32 file next to path,
+    then peak-normalized into a 16-bit WAV on close. Keeps full precision until
+    the peak is known instead of requantizing int16 samples. The WAV goes to a
+    temporary file first and only replaces path when there is audio to keep.
+    """
+
+    def __init__(self, path, fs):
+        self.path = Path(path)
+        self.part_path = self.path.with_name(self.path.name + ".f32")
+        self.fs = fs
+        self.part = open(self.part_path, 'wb')
+        self.peak = 0.0
+        self.frames = 0
+
+    def write(self, x):
+        if len(x) == 0:
+            return
+        x = np.asarray(x, dtype=np.float32)
+        self.peak = max(self.peak, float(np.abs(x).max()))
+        self.frames += len(x)
+        self.part.write(x.tobytes())
+
+    def close(self, keep=True, chunk=1 << 20):
+        """Write the WAV if keep and any samples arrived. Returns True if it was written"""
+        self.part.close()
+        if not keep or self.frames == 0:
+            self.part_path.unlink()
+            return False
+        gain = 32767 / self.peak if self.peak > 0 else 0.0
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with wave.open(str(tmp_path), 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(int(self.fs))
+            data = np.memmap(self.part_path, dtype=np.float32, mode='r', shape=(self.frames,))
+            for start in range(0, self.frames, chunk):
+                block = np.rint(data[start:start + chunk] * gain)
+                wav.writeframes(np.clip(block, -32767, 32767).astype('<i2').tobytes())
+            del data
+        self.part_path.unlink()
+        tmp_path.replace(self.path)
+        return True
+
+
+def stream_to_wav(ring_name, wav_path, fs=1000.0, low_hz=BANDPASS_LOW_HZ, high_hz=BANDPASS_HIGH_HZ,
+                  poll_s=0.005):
+    """
+    Worker process: consume the ring until capture is done, resample,
+    bandpass and append to the audio stream as reports arrive; the WAV is
+    written from it once capture is done.
+    """
+    ring = ReportRing(name=ring_name)
+    resampler = StreamResampler(fs)
+    bandpass = StreamBandpass(fs, low_hz, high_hz)
+    out = StreamWav(wav_path, fs)
+    try:
+        while True:
+            # Read the flag before peeking so reports pushed just before it aren't missed
+            done = ring.done
+            block = ring.peek()
+            if len(block):
+                x = block["x"].astype(float)
+                y = block["y"].astype(float)
+                mag = resampler.push(block["t"], np.sqrt(x**2 + y**2))
+                n = len(block)
+                del block
+                ring.release(n)
+                out.write(bandpass.push(mag))
+            elif done:
+                out.write(bandpass.push(resampler.flush()))
+                break
+            else:
+                del block
+                time.sleep(poll_s)
+    finally:
+        written = out.close(keep=not ring.failed)
+        ring.close()
+    if written:
+        print(f"Audio saved to: {wav_path} ({out.frames} samples)")
+    else:
+        print(f"No audio written, {wav_path} left untouched")
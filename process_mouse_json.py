@@ -4,12 +4,30 @@ import matplotlib.pyplot as plt
 from scipy import signal
 from pathlib import Path
 import argparse
+from gap_index import (index_gaps, gaps_to_json, gaps_from_json, summarize, split_segments,
+                       in_holes, DUPLICATE, DEFAULT_PARAMS)
+from lod_render import envelope_pyramid, spectrogram_pyramid, load_cache, LodLine, LodSpectrogram
+
+# Band used for the prepared signal, shared with the pipelined capture (pipeline.stream_to_wav)
+BANDPASS_LOW_HZ = 30.0
+BANDPASS_HIGH_HZ = 500.0
 
 def load_json(path):
     with open(path, 'r') as f:
         data = json.load(f)
     return data
 
+def decode_xy(b):
+    """
+    dx, dy of one report (bytes[1], bytes[2] as signed 8-bit), None if it is too short.
+    See decode_packets for the layout note.
+    """
+    if len(b) < 3:
+        return None
+    x = b[1] - 256 if b[1] > 127 else b[1]
+    y = b[2] - 256 if b[2] > 127 else b[2]
+    return x, y
+
 def decode_packets(raw_packets):
     """
     raw_packets: list of dicts with keys 't' and 'bytes' (hex string)
@@ -23,11 +41,10 @@ def decode_packets(raw_packets):
     dy = []
     for pkt in raw_packets:
         t = float(pkt['t'])
-        b = bytes.fromhex(pkt['bytes'])
-        if len(b) < 3:
+        xy = decode_xy(bytes.fromhex(pkt['bytes']))
+        if xy is None:
             continue
-        x = b[1] - 256 if b[1] > 127 else b[1]
-        y = b[2] - 256 if b[2] > 127 else b[2]
+        x, y = xy
         times.append(t)
         dx.append(x)
         dy.append(y)
@@ -36,16 +53,46 @@ def decode_packets(raw_packets):
 def build_magnitude(dx, dy):
     return np.sqrt(dx.astype(float)**2 + dy.astype(float)**2)
 
-def to_uniform(times, signal_array, fs_target=1000.0):
-
+def to_uniform(times, signal_array, fs_target=1000.0, gaps=None):
+    """
+    Resample onto a uniform grid.
+    gaps: gap table from gap_index.index_gaps. When given, grid samples inside
+    gaps/stalls are zero-filled instead of interpolated, duplicate reports are
+    dropped and the timeline is split at clock steps (segments are stitched
+    back one sample apart).
+    """
     if len(times) < 2:
         return np.array([]), np.array([])
-    t0 = times[0]
-    t1 = times[-1]
-    n_samples = max(2, int(np.ceil((t1 - t0) * fs_target)))
-    t_uniform = np.linspace(t0, t1, n_samples)
-    sig_uniform = np.interp(t_uniform, times, signal_array)
-    return t_uniform, sig_uniform
+    if gaps is None:
+        t0 = times[0]
+        t1 = times[-1]
+        n_samples = max(2, int(np.ceil((t1 - t0) * fs_target)))
+        t_uniform = np.linspace(t0, t1, n_samples)
+        sig_uniform = np.interp(t_uniform, times, signal_array)
+        return t_uniform, sig_uniform
+
+    times = np.asarray(times, dtype=float)
+    signal_array = np.asarray(signal_array, dtype=float)
+    keep = np.ones(len(times), dtype=bool)
+    keep[gaps["index"][gaps["kind"] == DUPLICATE] + 1] = False
+
+    t_parts = []
+    sig_parts = []
+    t_next = times[0]
+    for a, b in split_segments(len(times), gaps):
+        ts = times[a:b][keep[a:b]]
+        sig = signal_array[a:b][keep[a:b]]
+        n_samples = int(np.floor((ts[-1] - ts[0]) * fs_target + 1e-6)) + 1
+        t_seg = ts[0] + np.arange(n_samples) / fs_target
+        sig_seg = np.interp(t_seg, ts, sig)
+
+        seg_gaps = gaps[(gaps["index"] >= a) & (gaps["index"] < b - 1)]
+        sig_seg[in_holes(t_seg, seg_gaps)] = 0.0
+
+        t_parts.append(t_seg - t_seg[0] + t_next)
+        sig_parts.append(sig_seg)
+        t_next = t_parts[-1][-1] + 1.0 / fs_target
+    return np.concatenate(t_parts), np.concatenate(sig_parts)
 
 def bandpass(sig, fs, low_hz=50.0, high_hz=1000.0, order=4):
     nyq = 0.5 * fs
@@ -54,30 +101,67 @@ def bandpass(sig, fs, low_hz=50.0, high_hz=1000.0, order=4):
     b, a = signal.butter(order, [low, high], btype='band')
     return signal.filtfilt(b, a, sig)
 
-def plot_time_and_spectrogram(t, sig, fs, title_prefix=""):
+def plot_time_and_spectrogram(t, sig, fs, title_prefix="", cache_dir=None):
+    """
+    Waveform and spectrogram drawn at screen resolution from LOD pyramids
+    (see lod_render), cached in cache_dir when given.
+    """
+    if cache_dir is not None:
+        env, f, spec, clim = load_cache(cache_dir, t, sig, fs)
+    else:
+        env = envelope_pyramid(t, sig)
+        f, spec = spectrogram_pyramid(sig, fs)
+        clim = None
+
     plt.figure(figsize=(12, 8))
 
-    plt.subplot(2,1,1)
-    plt.plot(t - t[0], sig)
+    ax = plt.subplot(2,1,1)
+    LodLine(ax, env, t_offset=t[0])
     plt.xlabel("Time (s)")
     plt.ylabel("Magnitude (arb)")
     plt.title(f"{title_prefix} - Waveform (magnitude)")
 
-    plt.subplot(2,1,2)
-    f, t_spec, Sxx = signal.spectrogram(sig, fs=fs, nperseg=256, noverlap=192, scaling='spectrum')
-    plt.pcolormesh(t_spec, f, 10 * np.log10(Sxx + 1e-12), shading='gouraud')
+    ax = plt.subplot(2,1,2)
+    if spec:
+        image = LodSpectrogram(ax, f, spec, clim=clim).image
+        plt.colorbar(image, label='Power (dB)')
     plt.ylabel('Frequency (Hz)')
     plt.xlabel('Time (s)')
     plt.title(f"{title_prefix} - Spectrogram (dB)")
     plt.ylim(0, fs/2)
-    plt.colorbar(label='Power (dB)')
     plt.tight_layout()
     plt.show()
 
 def save_prepared(t_uniform, sig_uniform, out_prefix):
     np.savez_compressed(f"{out_prefix}.npz", t=t_uniform, x=sig_uniform)
 
-def main(path_json, out_prefix="prepared", fs_target=1000):
+def load_gaps(data, times, path_json=None):
+    """
+    Gap table from the capture metadata, computed (and stored back into the
+    JSON when path_json is given) if the capture doesn't have one yet.
+    """
+    meta = data.get("metadata", {})
+    if "gaps" in meta:
+        gaps = gaps_from_json(meta["gaps"])[0]
+        idx = gaps["index"]
+        # Only trust the table if it was built the same way over the same decoded reports
+        if (meta["gaps"].get("n_reports") == len(times)
+                and meta["gaps"].get("params") == DEFAULT_PARAMS
+                and np.all(idx < len(times) - 1)
+                and np.array_equal(times[idx], gaps["t_start"])):
+            print("Using gap table from capture metadata")
+            return gaps
+        print("Gap table in metadata doesn't match the decoded reports, recomputing")
+
+    gaps, nominal_dt = index_gaps(times)
+    if path_json is not None:
+        data.setdefault("metadata", {})["gaps"] = gaps_to_json(gaps, nominal_dt, len(times))
+        with open(path_json, 'w') as f:
+            json.dump(data, f, indent=2)
+        print(f"Gap table stored in {path_json}")
+    return gaps
+
+def main(path_json, out_prefix="prepared", fs_target=1000, store_gaps=False):
     data = load_json(path_json)
     raw_packets = data.get("raw_data", [])
     times, dx, dy = decode_packets(raw_packets)
@@ -88,18 +172,22 @@ def main(path_json, out_prefix="prepared", fs_target=1000):
     magnitude = build_magnitude(dx, dy)
     print(f"Decoded {len(times)} packets, duration {times[-1]-times[0]:.3f}s")
 
-    t_u, mag_u = to_uniform(times, magnitude, fs_target=fs_target)
+    gaps = load_gaps(data, times, path_json if store_gaps else None)
+    print("Timeline: " + ", ".join(f"{k}={v}" for k, v in summarize(gaps).items()))
+
+    t_u, mag_u = to_uniform(times, magnitude, fs_target=fs_target, gaps=gaps)
     if len(t_u) == 0:
         print("Uniform resampling failed.")
         return
 
     try:
-        mag_bp = bandpass(mag_u, fs=fs_target, low_hz=30.0, high_hz=500.0, order=4)
+        mag_bp = bandpass(mag_u, fs=fs_target, low_hz=BANDPASS_LOW_HZ, high_hz=BANDPASS_HIGH_HZ, order=4)
     except Exception as e:
         print("Bandpass filtering failed (maybe too few samples). Using raw uniform signal.")
         mag_bp = mag_u
 
-    plot_time_and_spectrogram(t_u, mag_bp, fs_target, title_prefix=Path(path_json).stem)
+    plot_time_and_spectrogram(t_u, mag_bp, fs_target, title_prefix=Path(path_json).stem,
+                              cache_dir=Path(path_json).with_suffix(".lod"))
 
     save_prepared(t_u, mag_bp, out_prefix)
     print(f"Prepared data saved to {out_prefix}.npz")
@@ -109,5 +197,6 @@ if __name__ == "__main__":
     parser.add_argument("jsonfile", help="Path to mouse JSON file")
     parser.add_argument("--out", default="prepared", help="Output prefix (.npz)")
     parser.add_argument("--fs", type=float, default=1000.0, help="Target sampling rate in Hz for interpolation")
+    parser.add_argument("--store-gaps", action="store_true", help="Write the gap table into the JSON metadata")
     args = parser.parse_args()
-    main(args.jsonfile, out_prefix=args.out, fs_target=args.fs)
+    main(args.jsonfile, out_prefix=args.out, fs_target=args.fs, store_gaps=args.store_gaps)